@@ -0,0 +1,70 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import NamedTuple, Optional
+
+import aiofiles
+
+CACHE_DIR = os.getenv("SEC_CACHE_DIR", ".cache")
+CACHE_TTL = int(os.getenv("SEC_CACHE_TTL", str(24 * 3600)))  # SEC data changes at most weekly
+
+class CacheEntry(NamedTuple):
+    fetched_at: float
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+class FileCache:
+    """
+    On-disk cache of raw response bodies, keyed by URL MD5:
+      <key>.gz    gzip'd body
+      <key>.json  {fetched_at, etag, last_modified} (validators for conditional GETs)
+    """
+
+    def __init__(self, root: str = CACHE_DIR, ttl: int = CACHE_TTL):
+        self.root = root
+        self.ttl = ttl
+
+    def _path(self, url: str, ext: str) -> str:
+        return os.path.join(self.root, hashlib.md5(url.encode()).hexdigest() + ext)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.fetched_at < self.ttl
+
+    async def lookup(self, url: str) -> Optional[CacheEntry]:
+        try:
+            async with aiofiles.open(self._path(url, ".json"), "r") as f:
+                meta = json.loads(await f.read())
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(meta["fetched_at"], meta.get("etag"), meta.get("last_modified"))
+
+    async def load(self, url: str) -> Optional[bytes]:
+        try:
+            async with aiofiles.open(self._path(url, ".gz"), "rb") as f:
+                raw = await f.read()
+        except OSError:
+            return None
+        return await asyncio.to_thread(gzip.decompress, raw)
+
+    async def store(self, url: str, content: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        await self._write(self._path(url, ".gz"), await asyncio.to_thread(gzip.compress, content))
+        await self._write_meta(url, CacheEntry(time.time(), etag, last_modified))
+
+    async def touch(self, url: str, entry: CacheEntry) -> None:
+        """Restart the TTL of an entry the server confirmed unchanged (304)."""
+        await self._write_meta(url, entry._replace(fetched_at=time.time()))
+
+    async def _write_meta(self, url: str, entry: CacheEntry) -> None:
+        await self._write(self._path(url, ".json"), json.dumps(entry._asdict()).encode())
+
+    async def _write(self, path: str, data: bytes) -> None:
+        # write-then-rename so concurrent readers never see a partial file
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(tmp, "wb") as f:
+            await f.write(data)
+        os.replace(tmp, path)
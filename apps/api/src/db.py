@@ -3,18 +3,29 @@ import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./dev.db")
+def normalize_url(url: str) -> str:
+    """Normalize Postgres URLs (incl. Heroku-style postgres://) to the psycopg v3 driver."""
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+psycopg://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+psycopg://", 1)
+    return url
 
-# Normalize to psycopg v3 driver
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+psycopg://", 1)
-elif DATABASE_URL.startswith("postgresql://") and "+psycopg" not in DATABASE_URL:
-    DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg://", 1)
+DATABASE_URL = normalize_url(os.getenv("DATABASE_URL", "sqlite:///./dev.db"))
 
 connect_args = {}
+engine_args = {}
 if DATABASE_URL.startswith("sqlite"):
     connect_args["check_same_thread"] = False
+else:
+    # Room for concurrent imports + metric reads; defaults (5 + 10 overflow) starve
+    engine_args["pool_size"] = int(os.getenv("DB_POOL_SIZE", "20"))
+    engine_args["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+    engine_args["pool_recycle"] = 1800
+    # psycopg prepares a statement server-side once it has run this many times on
+    # a connection (its default is 5; None would disable it). Set 0 to prepare everything.
+    connect_args["prepare_threshold"] = int(os.getenv("DB_PREPARE_THRESHOLD", "1"))
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, connect_args=connect_args)
+engine = create_engine(DATABASE_URL, pool_pre_ping=True, connect_args=connect_args, **engine_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -1,6 +1,11 @@
+import asyncio
+import time
 import httpx
-from datetime import datetime, date
-from typing import Dict, List, Optional
+import pandas as pd
+import simdjson
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from .cache import FileCache
 
 # Be polite: SEC requires a descriptive User-Agent with contact info
 SEC_HEADERS = {
@@ -9,6 +14,102 @@ SEC_HEADERS = {
     "Host": "data.sec.gov",
 }
 
+# One shared client so the TCP/TLS connection to data.sec.gov is reused across
+# requests; HTTP/2 multiplexes concurrent fetches over that single connection.
+_CLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=30.0,
+    headers=SEC_HEADERS,
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+)
+
+# SEC fair-access policy: at most 10 requests/second per client
+SEC_MAX_RPS = 10
+_MAX_RETRIES = 4
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class _RateLimiter:
+    """Spaces out request starts so a host sees at most `rate` requests per second."""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+_LIMITERS: Dict[str, _RateLimiter] = {}
+# Cap on SEC requests in flight at once (e.g. gathered fetches across endpoints)
+_INFLIGHT = asyncio.Semaphore(8)
+
+_CACHE = FileCache()
+
+async def _get(url: str, headers: Optional[Dict[str, str]] = None, *, stream: bool = False) -> httpx.Response:
+    """
+    GET through the shared client, rate-limited per host. Retries throttling (429),
+    5xx and transport errors with exponential backoff (0.5s, 1s, 2s, 4s).
+    With stream=True the body is left unread; the caller must aclose() the response.
+    """
+    host = httpx.URL(url).host
+    limiter = _LIMITERS.get(host)
+    if limiter is None:
+        limiter = _LIMITERS[host] = _RateLimiter(SEC_MAX_RPS)
+    for attempt in range(_MAX_RETRIES):
+        await limiter.wait()
+        try:
+            async with _INFLIGHT:
+                r = await _CLIENT.send(_CLIENT.build_request("GET", url, headers=headers), stream=stream)
+            if r.status_code not in _RETRY_STATUS:
+                break
+            await r.aclose()
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5 * 2 ** attempt)
+    else:
+        # last attempt: let transport errors / error statuses surface
+        await limiter.wait()
+        async with _INFLIGHT:
+            r = await _CLIENT.send(_CLIENT.build_request("GET", url, headers=headers), stream=stream)
+    # Not Modified answers a conditional GET; see _fetch
+    if r.status_code != 304 and r.is_error:
+        await r.aclose()
+        r.raise_for_status()
+    return r
+
+async def _fetch(url: str) -> bytes:
+    """
+    Body of an SEC URL via the on-disk cache: fresh entries are served without a
+    request; stale ones are revalidated with If-None-Match / If-Modified-Since.
+    """
+    entry = await _CACHE.lookup(url)
+    if entry and _CACHE.is_fresh(entry):
+        content = await _CACHE.load(url)
+        if content is not None:
+            return content
+    headers = {}
+    if entry and entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry and entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+    r = await _get(url, headers=headers)
+    if r.status_code == 304:
+        content = await _CACHE.load(url)
+        if content is not None:
+            await _CACHE.touch(url, entry)
+            return content
+        r = await _get(url)  # cache body vanished; refetch unconditionally
+    await _CACHE.store(url, r.content, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+    return r.content
+
+async def close_client() -> None:
+    await _CLIENT.aclose()
+
 def cik_from_symbol(symbol: str) -> Optional[str]:
     # Minimal demo mapping; extend as needed
     mapping = {
@@ -16,89 +117,148 @@ def cik_from_symbol(symbol: str) -> Optional[str]:
     }
     return mapping.get(symbol.upper())
 
-async def fetch_recent_submissions(cik: str) -> dict:
+def _parse(content: bytes) -> simdjson.Object:
+    """
+    Parse an SEC payload into a lazy simdjson proxy; nothing is turned into Python
+    objects until it is accessed. A fresh Parser per document, since reusing one
+    invalidates proxies returned by the previous parse.
+    """
+    return simdjson.Parser().parse(content)
+
+def _pointer(*parts: str) -> str:
+    """Build a JSON Pointer (RFC 6901), escaping '~' and '/' (units look like 'USD/shares')."""
+    return "".join("/" + p.replace("~", "~0").replace("/", "~1") for p in parts)
+
+async def fetch_recent_submissions(cik: str) -> simdjson.Object:
     url = f"https://data.sec.gov/submissions/CIK{cik}.json"
-    async with httpx.AsyncClient(timeout=30.0, headers=SEC_HEADERS) as client:
-        r = await client.get(url)
-        r.raise_for_status()
-        return r.json()
+    return _parse(await _fetch(url))
 
-async def fetch_company_facts(cik: str) -> dict:
+async def fetch_company_facts(cik: str) -> simdjson.Object:
     """
     SEC standardized metrics (XBRL) for a company.
     https://data.sec.gov/api/xbrl/companyfacts/CIK##########.json
     """
     url = f"https://data.sec.gov/api/xbrl/companyfacts/CIK{cik}.json"
-    async with httpx.AsyncClient(timeout=30.0, headers=SEC_HEADERS) as client:
-        r = await client.get(url)
-        r.raise_for_status()
-        return r.json()
+    return _parse(await _fetch(url))
+
+async def stream_company_facts(cik: str) -> httpx.Response:
+    """
+    Open companyfacts as a streamed response (body unread, bypassing the cache) for
+    passthrough. The caller must aclose() it.
+    """
+    url = f"https://data.sec.gov/api/xbrl/companyfacts/CIK{cik}.json"
+    return await _get(url, stream=True)
+
+def recent_filings(data: simdjson.Object, limit: Optional[int] = None) -> Dict[str, list]:
+    """
+    Materialize the columnar filings.recent block of a submissions payload
+    → {accessionNumber: [...], form: [...], filingDate: [...], reportDate: [...], primaryDocument: [...]}
+    Each column is reached by JSON Pointer; with limit, only its first `limit` entries are converted.
+    """
+    out = {}
+    for k in ("accessionNumber", "form", "filingDate", "reportDate", "primaryDocument"):
+        try:
+            col = data.at_pointer(_pointer("filings", "recent", k))
+        except (KeyError, TypeError):
+            out[k] = []
+            continue
+        out[k] = col.as_list() if limit is None else col[:limit]
+    return out
 
 def parse_yyyy_mm_dd(s: Optional[str]) -> Optional[date]:
     if not s:
         return None
     try:
-        return datetime.strptime(s, "%Y-%m-%d").date()
-    except Exception:
+        return date.fromisoformat(s)  # C fast path; strptime re-parses the format every call
+    except (TypeError, ValueError):
         return None
 
 # -------- helpers for companyfacts extraction --------
 
-def _pick_units(units: Dict[str, List[dict]], preferred: List[str]) -> Optional[List[dict]]:
+def _pick_units(units: simdjson.Object, preferred: List[str]) -> Optional[simdjson.Array]:
     """Pick a units list by preference (e.g., 'USD' for amounts, 'USD/shares' for EPS)."""
     if not units:
         return None
     for p in preferred:
         if p in units:
             return units[p]
-    # fallback: any unit with 'USD'
-    for k, v in units.items():
+    # fallback: any unit with 'USD'. Index by key so the result stays a lazy
+    # proxy; items()/values() would materialize every unit list.
+    for k in units.keys():
         if "USD" in k:
-            return v
+            return units[k]
     # last resort: first available
-    for v in units.values():
-        return v
+    for k in units.keys():
+        return units[k]
     return None
 
 def _extract_tag(values: List[dict], only_10k: bool = True) -> List[dict]:
     """
     Normalize values → [{end: date, filed: date, accn: str, form: str, val: float}]
     Filters to form == '10-K' if only_10k True.
+    Done with vectorized pandas ops; popular tags carry thousands of rows.
     """
-    out = []
-    for row in values or []:
-        form = row.get("form")
-        if only_10k and form != "10-K":
-            continue
-        end = parse_yyyy_mm_dd(row.get("end"))
-        filed = parse_yyyy_mm_dd(row.get("filed"))
-        val = row.get("val")
-        accn = row.get("accn")
-        if end and isinstance(val, (int, float)):
-            out.append({"end": end, "filed": filed, "accn": accn, "form": form, "val": float(val)})
-    # dedupe by (end, accn) keeping latest filed
-    out.sort(key=lambda r: (r["end"], r["filed"] or date.min))
-    dedup = {}
-    for r in out:
-        key = (r["end"], r.get("accn"))
-        dedup[key] = r
-    return list(dedup.values())
-
-def extract_series(facts: dict, tag_candidates: List[str], unit_pref: List[str]) -> List[dict]:
+    if not values:
+        return []
+    df = pd.DataFrame(values, columns=["end", "filed", "accn", "form", "val"])
+    if only_10k:
+        df = df[df["form"] == "10-K"]
+    df = df.assign(val=pd.to_numeric(df["val"], errors="coerce").astype(float)).dropna(subset=["end", "val"])
+    # dedupe by (end, accn) keeping latest filed. ISO dates sort correctly as
+    # strings, so only the surviving rows need parsing into dates.
+    df = df.sort_values(["end", "filed"], na_position="first")
+    df = df.drop_duplicates(subset=["end", "accn"], keep="last")
+    end = pd.to_datetime(df["end"], format="%Y-%m-%d", errors="coerce")
+    filed = pd.to_datetime(df["filed"], format="%Y-%m-%d", errors="coerce")
+    df = df.assign(end=end.dt.date, filed=filed.dt.date.astype(object).where(filed.notna(), None))
+    return df[end.notna()].to_dict("records")
+
+def _gaap(facts: simdjson.Object) -> Optional[simdjson.Object]:
+    if not facts:
+        return None
+    try:
+        return facts.at_pointer("/facts/us-gaap")
+    except (KeyError, TypeError):
+        return None
+
+def extract_from_gaap(gaap: simdjson.Object, tag_candidates: List[str], unit_pref: List[str]) -> List[dict]:
     """
-    From companyfacts, pick the first available tag from tag_candidates (taxonomy: us-gaap),
-    pick preferred units, and return normalized 10-K series.
+    extract_series on an already-resolved facts.us-gaap node.
+    Tags are looked up by JSON Pointer, so only the chosen units list is materialized.
     """
-    if not facts:
-        return []
-    gaap = (facts.get("facts") or {}).get("us-gaap") or {}
     for tag in tag_candidates:
-        node = gaap.get(tag)
-        if not node:
+        try:
+            units = gaap.at_pointer(_pointer(tag, "units"))
+        except (KeyError, TypeError):
             continue
-        units = node.get("units") or {}
         vals = _pick_units(units, unit_pref)
         if not vals:
             continue
-        return _extract_tag(vals, only_10k=True)
+        return _extract_tag(vals.as_list(), only_10k=True)
     return []
+
+def extract_series(facts: simdjson.Object, tag_candidates: List[str], unit_pref: List[str]) -> List[dict]:
+    """
+    From companyfacts, pick the first available tag from tag_candidates (taxonomy: us-gaap),
+    pick preferred units, and return normalized 10-K series.
+    """
+    gaap = _gaap(facts)
+    if gaap is None:
+        return []
+    return extract_from_gaap(gaap, tag_candidates, unit_pref)
+
+def extract_many(facts: simdjson.Object, wanted: Dict[str, Tuple[List[str], List[str]]]) -> Dict[str, List[dict]]:
+    """
+    Batch extract_series: wanted maps an output key → (tag_candidates, unit_pref).
+    us-gaap is resolved once and its tag names scanned once, so only candidates
+    that exist are looked up. (keys() only; items() would materialize every tag.)
+    """
+    gaap = _gaap(facts)
+    if gaap is None:
+        return {key: [] for key in wanted}
+    needed = {tag for cands, _ in wanted.values() for tag in cands}
+    present = {tag for tag in gaap.keys() if tag in needed}
+    return {
+        key: extract_from_gaap(gaap, [t for t in cands if t in present], unit_pref)
+        for key, (cands, unit_pref) in wanted.items()
+    }
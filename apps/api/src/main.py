@@ -1,29 +1,56 @@
+import asyncio
 from datetime import date
 from typing import Dict, List
 from fastapi import FastAPI, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.orm import Session, aliased, selectinload
+from sqlalchemy import Select, and_, func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
 from src.db import Base, engine, SessionLocal
+from src.migrate import upgrade
 from src.models import Company, Filing, Metric, MetricPoint
 from src.edgar import (
     fetch_recent_submissions, cik_from_symbol, parse_yyyy_mm_dd,
-    fetch_company_facts, extract_series
+    fetch_company_facts, extract_many, recent_filings, close_client,
+    stream_company_facts
 )
+from cachetools import TTLCache
+import orjson
 import yfinance as yf
 import os
 
-app = FastAPI(title="ERC API (10-K focus)")
+class ORJSONResponse(JSONResponse):
+    """JSON via orjson: several times faster than stdlib json, and encodes date natively."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+app = FastAPI(title="ERC API (10-K focus)", default_response_class=ORJSONResponse)
+
+# Wildcard origins can't carry credentials anyway; without them Starlette answers
+# with a constant "*" instead of echoing each request's Origin back.
+_cors_env = os.getenv("CORS_ALLOW_ORIGINS", "*").strip()
+CORS_ALLOW_ORIGINS = ("*",) if _cors_env == "*" else tuple(o.strip() for o in _cors_env.split(",") if o.strip())
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=os.getenv("CORS_ALLOW_ORIGINS", "*").split(","),
-    allow_credentials=True,
+    allow_origins=CORS_ALLOW_ORIGINS,
+    allow_credentials=CORS_ALLOW_ORIGINS != ("*",),
     allow_methods=["*"],
     allow_headers=["*"],
 )
-Base.metadata.create_all(bind=engine)
+
+@app.on_event("startup")
+def startup():
+    # once per process, not at import time
+    Base.metadata.create_all(bind=engine)
+    upgrade(engine)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_client()
 
 def get_db():
     db = SessionLocal()
@@ -32,6 +59,55 @@ def get_db():
     finally:
         db.close()
 
+def point_upsert(db: Session, rows_from: Select | None = None):
+    """
+    INSERT into metric_points that updates value (and source filing, when known)
+    on (metric_id, filed_at) conflicts, using the bound engine's dialect.
+    With rows_from, rows come from that SELECT of
+    (metric_id, filed_at, period_end, value, source_filing_id) instead of parameters.
+    """
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(MetricPoint)
+    if rows_from is not None:
+        stmt = stmt.from_select(["metric_id", "filed_at", "period_end", "value", "source_filing_id"], rows_from)
+    return stmt.on_conflict_do_update(
+        index_elements=["metric_id", "filed_at"],
+        set_={
+            "value": stmt.excluded.value,
+            "source_filing_id": func.coalesce(stmt.excluded.source_filing_id, MetricPoint.source_filing_id),
+        },
+    )
+
+def import_filings(db: Session, company: Company, recent: Dict[str, list]) -> tuple[int, int]:
+    """
+    Add the 10-K filings from a submissions recent block that are not stored yet
+    (metadata only). Known accessions are looked up in one query. → (inserted, skipped)
+    """
+    allowed_forms = {"10-K"}
+    acc = recent["accessionNumber"]
+    forms = recent["form"]
+    filed = recent["filingDate"]
+    report = recent["reportDate"]
+
+    wanted = [i for i in range(len(acc)) if i < len(forms) and forms[i] in allowed_forms]
+    known = {a for (a,) in db.query(Filing.accession).filter(Filing.accession.in_([acc[i] for i in wanted]))}
+    new_filings = []
+    for i in wanted:
+        accession = acc[i]
+        if accession in known:
+            continue
+        known.add(accession)
+        new_filings.append(Filing(
+            company_id=company.id,
+            accession=accession,
+            form_type=forms[i],
+            filed_at=parse_yyyy_mm_dd(filed[i] if i < len(filed) else None),
+            period_end=parse_yyyy_mm_dd(report[i] if i < len(report) else None),
+            parse_status="imported",
+        ))
+    db.add_all(new_filings)
+    return len(new_filings), len(wanted) - len(new_filings)
+
 @app.get("/")
 def root():
     return RedirectResponse(url="/docs")
@@ -43,13 +119,14 @@ def filings(symbol: str, db: Session = Depends(get_db)):
     if not c:
         return []
     rows = db.query(Filing).filter_by(company_id=c.id).order_by(Filing.filed_at.desc()).all()
-    return [{
+    # Returned as a response directly to skip jsonable_encoder; orjson writes dates as ISO strings
+    return ORJSONResponse([{
         "accession": f.accession,
         "form": f.form_type,
-        "periodEnd": f.period_end.isoformat() if isinstance(f.period_end, date) else f.period_end,
-        "filedAt":   f.filed_at.isoformat()   if isinstance(f.filed_at,   date) else f.filed_at,
+        "periodEnd": f.period_end,
+        "filedAt":   f.filed_at,
         "parseStatus": f.parse_status or "seed",
-    } for f in rows]
+    } for f in rows])
 
 @app.get("/api/tickers/{symbol}/metrics")
 def metrics(symbol: str, db: Session = Depends(get_db)):
@@ -60,16 +137,15 @@ def metrics(symbol: str, db: Session = Depends(get_db)):
     if not c:
         return {"series": []}
     out = []
-    metrics = db.query(Metric).filter_by(company_id=c.id).all()
+    # selectinload fetches all points in one extra "metric_id IN (...)" query
+    metrics = db.query(Metric).options(selectinload(Metric.points)).filter_by(company_id=c.id).all()
     for m in metrics:
-        pts = db.query(MetricPoint).filter_by(metric_id=m.id).order_by(MetricPoint.filed_at.asc()).all()
         out.append({
             "key": m.metric_key,
             "unit": m.unit,
-            "points": [{"date": p.filed_at.isoformat() if isinstance(p.filed_at, date) else p.filed_at,
-                        "value": p.value} for p in pts]
+            "points": [{"date": p.filed_at, "value": p.value} for p in m.points]
         })
-    return {"series": out}
+    return ORJSONResponse({"series": out})
 
 @app.get("/api/filings/{accession}/summary")
 def summary(accession: str):
@@ -89,14 +165,14 @@ async def edgar_recent(symbol: str):
     if not cik:
         raise HTTPException(status_code=400, detail="Unknown symbol in demo mapping")
     data = await fetch_recent_submissions(cik)
-    recent = data.get("filings", {}).get("recent", {})
+    recent = recent_filings(data, limit=10)
     out = []
-    if recent:
-        acc = recent.get("accessionNumber", [])
-        forms = recent.get("form", [])
-        filed = recent.get("filingDate", [])
-        report = recent.get("reportDate", [])
-        prim = recent.get("primaryDocument", [])
+    if recent["accessionNumber"]:
+        acc = recent["accessionNumber"]
+        forms = recent["form"]
+        filed = recent["filingDate"]
+        report = recent["reportDate"]
+        prim = recent["primaryDocument"]
         for i in range(min(10, len(acc))):
             if forms[i] != "10-K":
                 continue
@@ -126,42 +202,25 @@ async def edgar_import(symbol: str, db: Session = Depends(get_db)):
         db.add(company)
         db.flush()
 
-    recent = data.get("filings", {}).get("recent", {})
-    if not recent:
+    recent = recent_filings(data)
+    if not recent["accessionNumber"]:
         return {"inserted": 0, "skipped": 0, "message": "No recent filings in SEC response."}
 
-    allowed_forms = {"10-K"}
-    acc = recent.get("accessionNumber", [])
-    forms = recent.get("form", [])
-    filed = recent.get("filingDate", [])
-    report = recent.get("reportDate", [])
-
-    inserted = 0
-    skipped = 0
-    for i in range(len(acc)):
-        form = forms[i] if i < len(forms) else None
-        if form not in allowed_forms:
-            continue
-        accession = acc[i]
-        if db.query(Filing).filter_by(accession=accession).first():
-            skipped += 1
-            continue
-        filed_at = parse_yyyy_mm_dd(filed[i] if i < len(filed) else None)
-        period_end = parse_yyyy_mm_dd(report[i] if i < len(report) else None)
-        f = Filing(
-            company_id=company.id,
-            accession=accession,
-            form_type=form,
-            filed_at=filed_at,
-            period_end=period_end,
-            parse_status="imported",
-        )
-        db.add(f)
-        inserted += 1
-
+    inserted, skipped = import_filings(db, company, recent)
     db.commit()
     return {"company": {"symbol": company.symbol, "name": company.name}, "inserted": inserted, "skipped": skipped}
 
+@app.get("/api/edgar/{symbol}/facts/raw")
+async def facts_raw(symbol: str):
+    """
+    Raw SEC companyfacts JSON, streamed through as received (never parsed or re-serialized).
+    """
+    cik = cik_from_symbol(symbol)
+    if not cik:
+        raise HTTPException(status_code=400, detail="Unknown symbol in demo mapping")
+    r = await stream_company_facts(cik)
+    return StreamingResponse(r.aiter_bytes(), media_type="application/json", background=BackgroundTask(r.aclose))
+
 # ===== EDGAR companyfacts → DB (10-K metrics) =====
 @app.get("/api/edgar/{symbol}/facts/import")
 async def facts_import(symbol: str, db: Session = Depends(get_db)):
@@ -178,68 +237,59 @@ async def facts_import(symbol: str, db: Session = Depends(get_db)):
       - cfo (USDm)
       - capex (USDm)         # usually negative in CF, we store as-is
       - fcf (USDm)           # computed as cfo + capex
-    Points aligned by period_end and linked to source_filing when possible.
+    Recent 10-K filings are imported first (as /import does), then
+    points aligned by period_end and linked to source_filing when possible.
     """
-    from sqlalchemy import and_
     cik = cik_from_symbol(symbol)
     if not cik:
         raise HTTPException(status_code=400, detail="Unknown symbol in demo mapping")
 
+    # Independent GETs; filings come along so points can link to their source 10-K
+    subs, facts = await asyncio.gather(fetch_recent_submissions(cik), fetch_company_facts(cik))
+
     company = db.query(Company).filter_by(symbol=symbol).first()
     if not company:
-        company = Company(symbol=symbol, cik=cik, name=symbol)
+        company = Company(symbol=symbol, cik=cik, name=subs.get("name") or symbol)
         db.add(company); db.flush()
+    filings_inserted, _ = import_filings(db, company, recent_filings(subs))
+    db.flush()
 
-    facts = await fetch_company_facts(cik)
+    series = extract_many(facts, {
+        # Base series
+        "rev":    (["RevenueFromContractWithCustomerExcludingAssessedTax","SalesRevenueNet","Revenues"], ["USD"]),
+        "gp":     (["GrossProfit"], ["USD"]),
+        "eps":    (["EarningsPerShareDiluted"], ["USD/shares","USD/share"]),
+        "assets": (["Assets"], ["USD"]),
+        "liabs":  (["Liabilities"], ["USD"]),
+        # New series
+        "opinc":  (["OperatingIncomeLoss"], ["USD"]),
+        "netinc": (["NetIncomeLoss","ProfitLoss"], ["USD"]),
+        "equity": (["StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest","StockholdersEquity"], ["USD"]),
+        "cfo":    (["NetCashProvidedByUsedInOperatingActivities"], ["USD"]),
+        "capex":  (["PaymentsToAcquirePropertyPlantAndEquipment","PaymentsForProceedsFromProductiveAssets"], ["USD"]),
+    })
 
-    # Base series
-    rev     = extract_series(facts, ["RevenueFromContractWithCustomerExcludingAssessedTax","SalesRevenueNet","Revenues"], ["USD"])
-    gp      = extract_series(facts, ["GrossProfit"], ["USD"])
-    eps     = extract_series(facts, ["EarningsPerShareDiluted"], ["USD/shares","USD/share"])
-    assets  = extract_series(facts, ["Assets"], ["USD"])
-    liabs   = extract_series(facts, ["Liabilities"], ["USD"])
-
-    # New series
-    opinc   = extract_series(facts, ["OperatingIncomeLoss"], ["USD"])
-    netinc  = extract_series(facts, ["NetIncomeLoss","ProfitLoss"], ["USD"])
-    equity  = extract_series(facts, ["StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest","StockholdersEquity"], ["USD"])
-    cfo     = extract_series(facts, ["NetCashProvidedByUsedInOperatingActivities"], ["USD"])
-    capex   = extract_series(facts, ["PaymentsToAcquirePropertyPlantAndEquipment","PaymentsForProceedsFromProductiveAssets"], ["USD"])
+    # Prefetch everything the upserts need, so the loops below are dict lookups
+    # instead of per-row SELECTs.
+    metrics_by_key: Dict[str, Metric] = {m.metric_key: m for m in db.query(Metric).filter_by(company_id=company.id)}
+    by_accn: Dict[str, int] = {}
+    by_period_end: Dict[date, int] = {}
+    for f_id, accn, form, per_end in db.query(Filing.id, Filing.accession, Filing.form_type, Filing.period_end).filter_by(company_id=company.id):
+        by_accn[accn] = f_id
+        if form == "10-K" and per_end:
+            by_period_end.setdefault(per_end, f_id)
 
     # helpers
     def upsert_metric(key: str, unit: str) -> Metric:
-        m = db.query(Metric).filter_by(company_id=company.id, metric_key=key).first()
+        m = metrics_by_key.get(key)
         if not m:
             m = Metric(company_id=company.id, metric_key=key, unit=unit)
-            db.add(m); db.flush()
+            db.add(m)
         else:
             if not m.unit:
                 m.unit = unit
         return m
 
-    def filing_id_for(accn: str | None, end_date: date | None) -> int | None:
-        if accn:
-            f = db.query(Filing).filter_by(accession=accn).first()
-            if f: return f.id
-        if end_date:
-            f = db.query(Filing).filter(and_(Filing.company_id == company.id, Filing.form_type == "10-K", Filing.period_end == end_date)).first()
-            if f: return f.id
-        return None
-
-    def upsert_points(metric: Metric, series: List[dict], *, scale_millions: bool = False):
-        for row in series:
-            d: date = row["end"]
-            v: float = row["val"]
-            if scale_millions:
-                v = v / 1_000_000.0
-            src_id = filing_id_for(row.get("accn"), d)
-            existing = db.query(MetricPoint).filter_by(metric_id=metric.id, filed_at=d).first()
-            if existing:
-                existing.value = v
-                if src_id: existing.source_filing_id = src_id
-            else:
-                db.add(MetricPoint(metric_id=metric.id, filed_at=d, period_end=d, value=v, source_filing_id=src_id))
-
     # Create metrics
     m_rev   = upsert_metric("revenue", "USDm")
     m_gp    = upsert_metric("gross_profit", "USDm")
@@ -253,69 +303,90 @@ async def facts_import(symbol: str, db: Session = Depends(get_db)):
     m_cfo   = upsert_metric("cfo", "USDm")
     m_capex = upsert_metric("capex", "USDm")
     m_fcf   = upsert_metric("fcf", "USDm")
+    db.flush()  # assign ids to any new metrics in one go
+
+    # (metric_id, date) → row; a later row for the same date wins
+    rows: Dict[tuple, dict] = {}
+
+    def filing_id_for(accn: str | None, end_date: date | None) -> int | None:
+        return by_accn.get(accn) or by_period_end.get(end_date)
+
+    def put_point(metric: Metric, d: date, v: float, src_id: int | None):
+        rows[(metric.id, d)] = {"metric_id": metric.id, "filed_at": d, "period_end": d, "value": v, "source_filing_id": src_id}
+
+    def upsert_points(metric: Metric, series: List[dict], *, scale_millions: bool = False):
+        for row in series:
+            d: date = row["end"]
+            v: float = row["val"]
+            if scale_millions:
+                v = v / 1_000_000.0
+            put_point(metric, d, v, filing_id_for(row.get("accn"), d))
 
     # Upsert base & new series (scale USD → USDm where appropriate)
-    upsert_points(m_rev,   rev,   scale_millions=True)
-    upsert_points(m_gp,    gp,    scale_millions=True)
-    upsert_points(m_eps,   eps,   scale_millions=False)
-    upsert_points(m_ast,   assets,scale_millions=True)
-    upsert_points(m_liab,  liabs, scale_millions=True)
-    upsert_points(m_oi,    opinc, scale_millions=True)
-    upsert_points(m_ni,    netinc,scale_millions=True)
-    upsert_points(m_eq,    equity,scale_millions=True)
-    upsert_points(m_cfo,   cfo,   scale_millions=True)
-    upsert_points(m_capex, capex, scale_millions=True)
+    upsert_points(m_rev,   series["rev"],   scale_millions=True)
+    upsert_points(m_gp,    series["gp"],    scale_millions=True)
+    upsert_points(m_eps,   series["eps"],   scale_millions=False)
+    upsert_points(m_ast,   series["assets"],scale_millions=True)
+    upsert_points(m_liab,  series["liabs"], scale_millions=True)
+    upsert_points(m_oi,    series["opinc"], scale_millions=True)
+    upsert_points(m_ni,    series["netinc"],scale_millions=True)
+    upsert_points(m_eq,    series["equity"],scale_millions=True)
+    upsert_points(m_cfo,   series["cfo"],   scale_millions=True)
+    upsert_points(m_capex, series["capex"], scale_millions=True)
+
+    # Base points go out as one batched INSERT ... ON CONFLICT DO UPDATE
+    if rows:
+        db.execute(point_upsert(db), list(rows.values()))
+
+    # Derived series are computed by the database with INSERT ... SELECT over the
+    # points just written (plus any older ones), joined on date.
+    a = aliased(MetricPoint)
+    b = aliased(MetricPoint)
 
     # Compute GM = GP / Revenue
-    rev_by_date: Dict[date, float] = {}
-    gp_by_date: Dict[date, float]  = {}
-    for p in db.query(MetricPoint).filter_by(metric_id=m_rev.id).all():
-        rev_by_date[p.filed_at] = p.value
-    for p in db.query(MetricPoint).filter_by(metric_id=m_gp.id).all():
-        gp_by_date[p.filed_at] = p.value
-    for d, rv in rev_by_date.items():
-        gpv = gp_by_date.get(d)
-        if gpv is None or rv == 0:
-            continue
-        gm_val = gpv / rv
-        existing = db.query(MetricPoint).filter_by(metric_id=m_gm.id, filed_at=d).first()
-        if existing: existing.value = gm_val
-        else:
-            src = db.query(Filing).filter(and_(Filing.company_id == company.id, Filing.form_type=="10-K", Filing.period_end==d)).first()
-            db.add(MetricPoint(metric_id=m_gm.id, filed_at=d, period_end=d, value=gm_val, source_filing_id=src.id if src else None))
+    db.execute(point_upsert(db, select(literal(m_gm.id), a.filed_at, a.filed_at, b.value / a.value, a.source_filing_id)
+                                .join(b, and_(b.filed_at == a.filed_at, b.metric_id == m_gp.id))
+                                .where(a.metric_id == m_rev.id, a.value != 0)))
 
     # Compute FCF = CFO + Capex (capex is typically negative outflow)
-    cfo_by_date: Dict[date, float] = {p.filed_at: p.value for p in db.query(MetricPoint).filter_by(metric_id=m_cfo.id).all()}
-    capex_by_date: Dict[date, float] = {p.filed_at: p.value for p in db.query(MetricPoint).filter_by(metric_id=m_capex.id).all()}
-    for d, cfo_v in cfo_by_date.items():
-        capex_v = capex_by_date.get(d)
-        if capex_v is None: continue
-        fcf_v = cfo_v + capex_v
-        existing = db.query(MetricPoint).filter_by(metric_id=m_fcf.id, filed_at=d).first()
-        if existing: existing.value = fcf_v
-        else:
-            src = db.query(Filing).filter(and_(Filing.company_id == company.id, Filing.form_type=="10-K", Filing.period_end==d)).first()
-            db.add(MetricPoint(metric_id=m_fcf.id, filed_at=d, period_end=d, value=fcf_v, source_filing_id=src.id if src else None))
+    db.execute(point_upsert(db, select(literal(m_fcf.id), a.filed_at, a.filed_at, a.value + b.value, a.source_filing_id)
+                                .join(b, and_(b.filed_at == a.filed_at, b.metric_id == m_capex.id))
+                                .where(a.metric_id == m_cfo.id)))
 
     db.commit()
     return {
         "inserted_or_updated": True,
+        "filings_inserted": filings_inserted,
         "metrics": ["revenue","gross_profit","gm","operating_income","net_income","assets","liabilities","equity","cfo","capex","fcf"],
         "note": "USD millions (except eps_diluted in USD/sh). GM is a ratio (0–1).",
     }
 
 # ===== Price (yfinance) =====
+# (symbol, range, interval) → series; hot tickers get requested over and over
+_price_cache: TTLCache = TTLCache(maxsize=256, ttl=60)
+
 @app.get("/api/price/{symbol}")
-def price(
+async def price(
     symbol: str,
     range: str = Query("1y", pattern="^(1mo|3mo|6mo|1y|5y|max)$"),
     interval: str = Query("1d", pattern="^(1d|1wk|1mo)$"),
 ):
+    key = (symbol, range, interval)
+    cached = _price_cache.get(key)  # one read; "in" then [] can race the TTL expiry
+    if cached is not None:
+        return {"series": cached}
     try:
-        df = yf.download(symbol, period=range, interval=interval, auto_adjust=True, progress=False)
+        # yf.download blocks on network I/O; keep it off the event loop
+        df = await asyncio.to_thread(yf.download, symbol, period=range, interval=interval, auto_adjust=True, progress=False)
         if df is None or df.empty:
-            return {"series": []}
-        out = [{"date": idx.strftime("%Y-%m-%d"), "close": float(row["Close"])} for idx, row in df.iterrows()]
+            out = []
+        else:
+            close = df["Close"]
+            if close.ndim == 2:  # newer yfinance returns one column per ticker
+                close = close.iloc[:, 0]
+            dates = df.index.strftime("%Y-%m-%d").tolist()
+            out = [{"date": d, "close": c} for d, c in zip(dates, close.astype(float).tolist())]
+        _price_cache[key] = out
         return {"series": out}
     except Exception as e:
         return {"series": [], "error": str(e)}
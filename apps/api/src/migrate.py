@@ -0,0 +1,32 @@
+"""
+In-place schema upgrades for databases created by older versions of the models.
+create_all only creates missing tables, never new indexes on existing ones, so
+index changes land here. Every step is idempotent (sqlite and postgres); run it
+after create_all and before serving requests.
+"""
+from sqlalchemy import Engine, Index, inspect, text
+from src.models import Filing, MetricPoint
+
+def _index(model, name: str) -> Index:
+    return next(ix for ix in model.__table__.indexes if ix.name == name)
+
+def upgrade(engine: Engine) -> None:
+    with engine.begin() as conn:
+        mp_indexes = {ix["name"] for ix in inspect(conn).get_indexes("metric_points")}
+        if "ix_mp_metric_date" not in mp_indexes:
+            # Older imports (read-then-insert with autoflush off) could store the same
+            # point several times; keep the newest row so the unique index can be built.
+            conn.execute(text("""
+                DELETE FROM metric_points
+                WHERE filed_at IS NOT NULL
+                  AND id NOT IN (SELECT MAX(id) FROM metric_points
+                                 WHERE filed_at IS NOT NULL
+                                 GROUP BY metric_id, filed_at)
+            """))
+            _index(MetricPoint, "ix_mp_metric_date").create(conn)
+        # leading column of ix_mp_metric_date
+        conn.execute(text("DROP INDEX IF EXISTS ix_metric_points_metric_id"))
+
+        _index(Filing, "ix_filing_co_form_end").create(conn, checkfirst=True)
+        # leading column of ix_filing_co_form_end
+        conn.execute(text("DROP INDEX IF EXISTS ix_filings_company_id"))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, Float, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Date, Float, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .db import Base
 
@@ -15,7 +15,7 @@ class Company(Base):
 class Filing(Base):
     __tablename__ = "filings"
     id = Column(Integer, primary_key=True)
-    company_id = Column(Integer, ForeignKey("companies.id"), index=True, nullable=False)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)  # indexed via ix_filing_co_form_end
     accession = Column(String, unique=True, index=True, nullable=False)
     form_type = Column(String, nullable=False)
     period_end = Column(Date, nullable=True)
@@ -24,6 +24,9 @@ class Filing(Base):
 
     company = relationship("Company", back_populates="filings")
 
+    # period-end lookup of a company's 10-K (source filing for metric points)
+    __table_args__ = (Index("ix_filing_co_form_end", "company_id", "form_type", "period_end"),)
+
 class Metric(Base):
     __tablename__ = "metrics"
     id = Column(Integer, primary_key=True)
@@ -32,17 +35,21 @@ class Metric(Base):
     unit = Column(String, nullable=True)
 
     company = relationship("Company", back_populates="metrics")
-    points = relationship("MetricPoint", back_populates="metric", cascade="all, delete-orphan")
+    points = relationship("MetricPoint", back_populates="metric", cascade="all, delete-orphan",
+                          order_by="MetricPoint.filed_at")
 
     __table_args__ = (UniqueConstraint("company_id", "metric_key", name="uq_company_metrickey"),)
 
 class MetricPoint(Base):
     __tablename__ = "metric_points"
     id = Column(Integer, primary_key=True)
-    metric_id = Column(Integer, ForeignKey("metrics.id"), index=True, nullable=False)
+    metric_id = Column(Integer, ForeignKey("metrics.id"), nullable=False)  # indexed via ix_mp_metric_date
     filed_at = Column(Date, nullable=True)
     period_end = Column(Date, nullable=True)
     value = Column(Float, nullable=False)
     source_filing_id = Column(Integer, ForeignKey("filings.id"), nullable=True)
 
     metric = relationship("Metric", back_populates="points")
+
+    # also the conflict target of the (metric_id, filed_at) upserts
+    __table_args__ = (Index("ix_mp_metric_date", "metric_id", "filed_at", unique=True),)
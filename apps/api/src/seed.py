@@ -1,10 +1,13 @@
 from datetime import date
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from src.db import Base, engine, SessionLocal
+from src.migrate import upgrade
 from src.models import Company, Filing, Metric, MetricPoint
 
 def seed():
     Base.metadata.create_all(bind=engine)
+    upgrade(engine)
     db: Session = SessionLocal()
     try:
         symbol = "AAPL"
@@ -40,13 +43,12 @@ def seed():
         rev_series = [("2023-06-30",81700),("2023-09-30",89500),("2023-12-31",119600),("2024-03-31",90700)]
         gm_series  = [("2023-06-30",0.445), ("2023-09-30",0.448), ("2023-12-31",0.458), ("2024-03-31",0.452)]
 
-        def to_date(s: str):
-            y,m,d = map(int, s.split("-")); return date(y,m,d)
+        to_date = date.fromisoformat
 
-        for ds, val in rev_series:
-            db.add(MetricPoint(metric_id=rev.id, filed_at=to_date(ds), period_end=to_date(ds), value=val))
-        for ds, val in gm_series:
-            db.add(MetricPoint(metric_id=gm.id,  filed_at=to_date(ds), period_end=to_date(ds), value=val))
+        # one multi-row INSERT instead of a unit-of-work INSERT per point
+        rows_rev = [{"metric_id": rev.id, "filed_at": to_date(ds), "period_end": to_date(ds), "value": val} for ds, val in rev_series]
+        rows_gm  = [{"metric_id": gm.id,  "filed_at": to_date(ds), "period_end": to_date(ds), "value": val} for ds, val in gm_series]
+        db.execute(insert(MetricPoint), rows_rev + rows_gm)
 
         db.commit()
         print("Seeded ./erc.db with AAPL filings and metrics.")